@@ -6,9 +6,27 @@
 """
 
 import os
+import re
 from pathlib import Path
+import time
+from typing import Iterable
 import zipfile
 
+try:
+    from lxml import etree
+except ImportError:
+    print("请安装必要的依赖包:")
+    print("pip install lxml")
+    exit(1)
+
+# content.xml的命名空间，由根元素声明为默认命名空间；
+# 子元素使用不带命名空间的标签名，按原样写出即属于该默认命名空间
+_CONTENT_NS = 'urn:xmind:xmap:xmlns:content:2.0'
+_TAG_XMAP = f'{{{_CONTENT_NS}}}xmap-content'
+
+# XML 1.0中不允许出现的字符（制表符、换行符、回车符以外的C0控制字符等）
+_RE_XML_ILLEGAL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
 
 class SimpleTestCaseToXMindConverter:
     """简化版测试用例转XMind转换器"""
@@ -25,12 +43,9 @@ class SimpleTestCaseToXMindConverter:
             output_file: 输出文件路径（可选）
         """
         try:
-            # 读取测试用例文件
+            # 逐行读取并解析测试用例文件
             with open(input_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # 解析内容
-            root_node = self._parse_content(content)
+                root_node = self._parse_content(f)
 
             # 生成输出文件名
             if not output_file:
@@ -47,13 +62,16 @@ class SimpleTestCaseToXMindConverter:
             print(f"转换过程中出错: {str(e)}")
             raise
 
-    def _parse_content(self, content: str):
-        """解析测试用例内容并构建层级结构"""
-        lines = content.strip().split('\n')
-        
+    def _parse_content(self, lines: Iterable[str]):
+        """
+        解析测试用例内容并构建层级结构
+
+        Args:
+            lines: 测试用例的各行内容，可以直接传入打开的文件对象
+        """
         # 创建根节点
         root_node = {
-            'id': self._get_next_id(),
+            'id': self._next_id(),
             'title': '测试用例',
             'children': []
         }
@@ -62,15 +80,12 @@ class SimpleTestCaseToXMindConverter:
         node_stack = [root_node]
         
         for line in lines:
-            if not line.strip():
-                continue
-                
             # 计算缩进级别
             indent_level = self._get_indent_level(line)
-            text = line.strip()
-            
-            # 清理文本
-            clean_text = self._clean_text(text)
+            # 移除XML中不允许出现的控制字符，避免个别异常字符导致整个转换失败
+            text = _RE_XML_ILLEGAL.sub('', line[indent_level:]).strip()
+            if not text:
+                continue
             
             # 调整栈的深度到正确的层级
             while len(node_stack) > indent_level + 1:
@@ -78,8 +93,8 @@ class SimpleTestCaseToXMindConverter:
             
             # 创建新节点
             new_node = {
-                'id': self._get_next_id(),
-                'title': clean_text,
+                'id': self._next_id(),
+                'title': text,
                 'children': []
             }
             
@@ -93,17 +108,6 @@ class SimpleTestCaseToXMindConverter:
 
     def _create_simple_xmind_file(self, root_node, output_file):
         """创建最简化的XMind文件"""
-        
-        # 逻辑图格式的content.xml
-        content_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
-<xmap-content xmlns="urn:xmind:xmap:xmlns:content:2.0" version="2.0">
-  <sheet id="sheet1">
-    <topic id="{root_node['id']}" structure-class="org.xmind.ui.logic.right">
-      <title>{root_node['title']}</title>
-{self._build_simple_children_xml(root_node['children'], 6)}
-    </topic>
-  </sheet>
-</xmap-content>'''
 
         # 最简化的meta.xml
         meta_xml = '''<?xml version="1.0" encoding="UTF-8"?>
@@ -117,70 +121,77 @@ class SimpleTestCaseToXMindConverter:
   <file-entry full-path="meta.xml" media-type="text/xml"/>
 </manifest>'''
 
-        # 创建XMind文件
-        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as xmind_zip:
-            xmind_zip.writestr('content.xml', content_xml)
-            xmind_zip.writestr('meta.xml', meta_xml)
-            xmind_zip.writestr('META-INF/manifest.xml', manifest_xml)
+        # 创建XMind文件：使用压缩级别1，以较大的文件体积换取更快的写入速度
+        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as xmind_zip:
+            # 逻辑图格式的content.xml，边遍历节点树边由lxml转义并写入压缩包
+            content_info = self._new_zip_info('content.xml', zipfile.ZIP_DEFLATED)
+            # 以ZipInfo方式打开时不会继承ZipFile的compresslevel，需要单独指定。
+            # Python 3.13起该属性公开为compress_level，更早的版本只能写私有属性_compresslevel
+            if hasattr(content_info, 'compress_level'):
+                content_info.compress_level = xmind_zip.compresslevel
+            else:
+                content_info._compresslevel = xmind_zip.compresslevel
+            with xmind_zip.open(content_info, 'w', force_zip64=True) as fh:
+                with etree.xmlfile(fh, encoding='UTF-8') as xf:
+                    xf.write_declaration()
+                    with xf.element(_TAG_XMAP, nsmap={None: _CONTENT_NS}, version='2.0'):
+                        with xf.element('sheet', id='sheet1'):
+                            self._write_topic_xml(xf, root_node)
+            # meta.xml和manifest.xml只有几百字节，直接存储不压缩
+            xmind_zip.writestr(self._new_zip_info('meta.xml', zipfile.ZIP_STORED), meta_xml)
+            xmind_zip.writestr(self._new_zip_info('META-INF/manifest.xml', zipfile.ZIP_STORED), manifest_xml)
+
+    def _new_zip_info(self, name: str, compress_type: int) -> zipfile.ZipInfo:
+        """创建以当前时间为修改时间的压缩包条目"""
+        zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+        zinfo.compress_type = compress_type
+        zinfo.external_attr = 0o600 << 16
+        return zinfo
+
+    def _write_topic_xml(self, xf, root_node):
+        """迭代写入根节点及其所有子节点的XML - 简化版"""
+        # 复用同一个title元素，由lxml负责转义文本
+        title = etree.Element('title')
+
+        # 栈中元素为待写入的节点，或已打开、待关闭的元素上下文
+        stack = [root_node]
+        while stack:
+            item = stack.pop()
+            if not isinstance(item, dict):
+                item.__exit__(None, None, None)
+                continue
 
-    def _build_simple_children_xml(self, children, indent_level):
-        """递归构建子节点XML - 简化版"""
-        if not children:
-            return ""
-        
-        indent = " " * indent_level
-        child_indent = " " * (indent_level + 2)
-        topic_indent = " " * (indent_level + 4)
-        
-        xml_parts = [f"{indent}<children>"]
-        xml_parts.append(f"{child_indent}<topics type=\"attached\">")
-        
-        for child in children:
-            xml_parts.append(f"{topic_indent}<topic id=\"{child['id']}\">")
-            xml_parts.append(f"{topic_indent}  <title>{child['title']}</title>")
-            
-            if child['children']:
-                xml_parts.append(self._build_simple_children_xml(child['children'], indent_level + 6))
-            
-            xml_parts.append(f"{topic_indent}</topic>")
-        
-        xml_parts.append(f"{child_indent}</topics>")
-        xml_parts.append(f"{indent}</children>")
-        
-        return "\n".join(xml_parts)
+            attrib = {'id': f"topic{item['id']}"}
+            if item is root_node:
+                attrib['structure-class'] = 'org.xmind.ui.logic.right'
+            topic = xf.element('topic', attrib)
+            topic.__enter__()
+            title.text = item['title']
+            xf.write(title)
+
+            children = item['children']
+            if not children:
+                topic.__exit__(None, None, None)
+                continue
+
+            children_el = xf.element('children')
+            children_el.__enter__()
+            topics_el = xf.element('topics', type='attached')
+            topics_el.__enter__()
+            # 先压入待关闭的元素，再逆序压入子节点，保证子节点按原顺序写完后再依次关闭
+            stack.append(topic)
+            stack.append(children_el)
+            stack.append(topics_el)
+            stack.extend(reversed(children))
 
     def _get_indent_level(self, line: str) -> int:
         """获取行的缩进级别"""
-        tab_count = 0
-        for char in line:
-            if char == '\t':
-                tab_count += 1
-            else:
-                break
-        return tab_count
-
-    def _clean_text(self, text: str) -> str:
-        """清理文本，移除前缀并转义特殊字符"""
-        # if text.startswith('测试点：'):
-        #     text = text[4:]
-        # elif text.startswith('用例步骤：'):
-        #     text = text[5:]
-        # elif text.startswith('预期结果：'):
-        #     text = text[5:]
-
-        # 转义XML特殊字符
-        text = text.replace('&', '&amp;')
-        text = text.replace('<', '&lt;')
-        text = text.replace('>', '&gt;')
-        text = text.replace('"', '&quot;')
-        text = text.replace("'", '&apos;')
-
-        return text
-
-    def _get_next_id(self) -> str:
-        """获取下一个节点ID"""
+        return len(line) - len(line.lstrip('\t'))
+
+    def _next_id(self) -> int:
+        """获取下一个节点ID，生成XML时再格式化为topic{ID}"""
         self.node_id_counter += 1
-        return f"topic{self.node_id_counter}"
+        return self.node_id_counter
 
 
 def main():
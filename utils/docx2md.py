@@ -9,7 +9,7 @@ import os
 import re
 import base64
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import argparse
 import logging
 
@@ -17,7 +17,7 @@ try:
     from docx import Document
     from docx.document import Document as _Document
     from docx.oxml.text.paragraph import CT_P
-    from docx.oxml.table import CT_Tbl
+    from docx.oxml.table import CT_Row, CT_Tbl, CT_Tc
     from docx.table import _Cell, Table
     from docx.text.paragraph import Paragraph
     from docx.shared import RGBColor
@@ -33,6 +33,15 @@ except ImportError:
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 预编译的正则表达式
+_RE_ORDERED = re.compile(r'^\d+\.')
+_RE_ALPHA = re.compile(r'^[a-zA-Z]\.')
+# 依次匹配无序标记、数字编号、字母编号，等价于按顺序逐个移除
+_RE_LIST_PREFIX = re.compile(r'^(?:[•·○■▪\-\*]\s*)?(?:\d+\.\s*)?(?:[a-zA-Z]\.\s*)?')
+
+# 无序列表标记
+_BULLETS = frozenset({'•', '·', '○', '■', '▪', '-', '*'})
+
 class WordToMarkdownConverter:
     """Word文档转Markdown转换器"""
     
@@ -53,7 +62,13 @@ class WordToMarkdownConverter:
         # self.extract_images = extract_images
         self.preserve_formatting = preserve_formatting
         # self.image_counter = 0
-        self.markdown_content = []
+        self._out = None  # 当前写入的Markdown文件
+        self._style_cache = {}  # 样式ID -> (是否为标题, 标题级别)
+        # 文档主体中各元素标签名对应的处理函数
+        self._element_handlers = {
+            ns.qn('w:p'): self._process_paragraph_element,
+            ns.qn('w:tbl'): self._process_table_element,
+        }
         # self.image_map = {}  # 存储图片ID到文件名的映射
         # self.image_reference_counter = 0  # 用于追踪已引用的图片数量
         
@@ -73,21 +88,21 @@ class WordToMarkdownConverter:
             
             # 加载Word文档
             doc = Document(docx_path)
+            self._style_cache = {}
 
-            self.markdown_content = []
-
-            # 处理文档内容
-            self._process_document(doc)
-            
             # 生成输出文件名
             if not output_name:
                 output_name = Path(docx_path).stem + ".md"
             
             output_path = self.output_dir / output_name
             
-            # 写入Markdown文件
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(self.markdown_content))
+            # 处理文档内容，边处理边写入Markdown文件
+            with open(output_path, 'w', encoding='utf-8', buffering=1 << 16) as f:
+                self._out = f
+                try:
+                    self._process_document(doc)
+                finally:
+                    self._out = None
             
             logger.info(f"转换完成，输出文件: {output_path}")
             return str(output_path)
@@ -96,6 +111,16 @@ class WordToMarkdownConverter:
             logger.error(f"转换过程中出错: {str(e)}")
             raise
     
+    def _emit(self, line: str):
+        """写入一行Markdown"""
+        self._out.write(line)
+        self._out.write('\n')
+    
+    def _emit_block(self, text: str):
+        """写入一个Markdown块，并在其后添加空行"""
+        self._out.write(text)
+        self._out.write('\n\n')
+    
     def _process_document(self, doc: _Document):
         """处理整个文档"""
         if doc is None:
@@ -117,19 +142,13 @@ class WordToMarkdownConverter:
                     logger.error(f"处理文档段落和表格时出错: {str(e)}")
                 return
             
+            # 按元素标签名分派处理函数
+            handlers = self._element_handlers
+            # 段落和表格的处理函数内部已捕获异常，这里不再为每个元素单独设置异常处理
             for element in doc.element.body:
-                try:
-                    if isinstance(element, CT_P):
-                        # 段落元素
-                        paragraph = Paragraph(element, doc)
-                        self._process_paragraph(paragraph)
-                    elif isinstance(element, CT_Tbl):
-                        # 表格元素
-                        table = Table(element, doc)
-                        self._process_table(table)
-                except Exception as e:
-                    logger.warning(f"处理文档元素时出错: {str(e)}")
-                    continue
+                handler = handlers.get(element.tag)
+                if handler is not None:
+                    handler(element, doc)
                     
         except Exception as e:
             logger.error(f"处理文档时出现严重错误: {str(e)}")
@@ -140,14 +159,21 @@ class WordToMarkdownConverter:
                     if paragraph and paragraph.text:
                         text = paragraph.text.strip()
                         if text:
-                            self.markdown_content.append(text)
-                            self.markdown_content.append('')
+                            self._emit_block(text)
             except Exception as fallback_e:
                 logger.error(f"备用文本提取也失败: {str(fallback_e)}")
         
         # 后处理：确保所有提取的图片都被引用
         # self._post_process_images()
     
+    def _process_paragraph_element(self, element: CT_P, doc: _Document):
+        """处理段落元素"""
+        self._process_paragraph(Paragraph(element, doc))
+    
+    def _process_table_element(self, element: CT_Tbl, doc: _Document):
+        """处理表格元素"""
+        self._process_table(Table(element, doc))
+    
     def _process_paragraph(self, paragraph: Paragraph):
         """处理段落"""
         if paragraph is None:
@@ -156,8 +182,9 @@ class WordToMarkdownConverter:
         try:
             # 先处理段落内容
             # 检查是否为标题
-            if self._is_heading(paragraph):
-                self._process_heading(paragraph)
+            is_heading, level = self._get_heading_info(paragraph)
+            if is_heading:
+                self._process_heading(paragraph, level)
             # 检查是否为列表
             elif self._is_list_item(paragraph):
                 self._process_list_item(paragraph)
@@ -172,45 +199,51 @@ class WordToMarkdownConverter:
             try:
                 text = paragraph.text if paragraph.text else ""
                 if text.strip():
-                    self.markdown_content.append(text.strip())
-                    self.markdown_content.append('')
+                    self._emit_block(text.strip())
             except:
                 pass
     
 
     
-    def _is_heading(self, paragraph: Paragraph) -> bool:
-        """判断是否为标题"""
-        if paragraph.style is None or paragraph.style.name is None:
-            return False
-        style_name = paragraph.style.name.lower()
-        return 'heading' in style_name or style_name.startswith('标题')
+    def _get_heading_info(self, paragraph: Paragraph) -> Tuple[bool, int]:
+        """
+        判断是否为标题并获取标题级别
+        
+        结果按段落的样式ID缓存，同一样式只解析一次样式名
+        
+        Returns:
+            (是否为标题, 标题级别)
+        """
+        style_id = paragraph._p.style
+        info = self._style_cache.get(style_id)
+        if info is None:
+            info = self._parse_heading_style(paragraph)
+            self._style_cache[style_id] = info
+        return info
     
-    def _process_heading(self, paragraph: Paragraph):
+    def _parse_heading_style(self, paragraph: Paragraph) -> Tuple[bool, int]:
+        """根据样式名解析是否为标题及标题级别"""
+        style = paragraph.style
+        if style is None or style.name is None:
+            return False, 1
+        style_name = style.name.lower()
+        if not ('heading' in style_name or style_name.startswith('标题')):
+            return False, 1
+        
+        # 提取标题级别：标题样式名以级别数字结尾，如 "heading 1"、"标题 2"
+        last = style_name[-1]
+        level = int(last) if '0' <= last <= '9' else 1
+        # Markdown只支持1-6级标题
+        return True, min(max(level, 1), 6)
+    
+    def _process_heading(self, paragraph: Paragraph, level: int = 1):
         """处理标题"""
         try:
-            # 提取标题级别
-            level = 1
-            if paragraph.style and paragraph.style.name:
-                style_name = paragraph.style.name.lower()
-                if 'heading' in style_name:
-                    # 尝试从样式名中提取级别
-                    import re
-                    level_match = re.search(r'(\d+)', style_name)
-                    if level_match:
-                        level = int(level_match.group(1))
-                elif '标题' in style_name:
-                    # 处理中文标题样式
-                    level_match = re.search(r'(\d+)', style_name)
-                    if level_match:
-                        level = int(level_match.group(1))
-            
             # 生成Markdown标题
             text = self._extract_text_with_formatting(paragraph)
             if text.strip():
                 heading_text = '#' * level + ' ' + text.strip()
-                self.markdown_content.append(heading_text)
-                self.markdown_content.append('')
+                self._emit_block(heading_text)
                 
                 # 在标题后尝试插入图片（更高优先级）
                 # self._try_insert_next_image(force_insert=True)
@@ -221,8 +254,7 @@ class WordToMarkdownConverter:
             try:
                 text = paragraph.text if paragraph.text else ""
                 if text.strip():
-                    self.markdown_content.append(f"# {text.strip()}")
-                    self.markdown_content.append('')
+                    self._emit_block(f"# {text.strip()}")
             except:
                 pass
     
@@ -247,13 +279,9 @@ class WordToMarkdownConverter:
             text = paragraph.text
             if text:
                 text = text.strip()
-                if text:
-                    # 无序列表标记
-                    if text.startswith(('•', '·', '○', '■', '▪', '-', '*')):
-                        return True
-                    # 有序列表标记
-                    if re.match(r'^\d+\.', text) or re.match(r'^[a-zA-Z]\.', text):
-                        return True
+                # 无序列表标记（均为单个字符）或有序列表标记
+                if text[:1] in _BULLETS or _RE_ORDERED.match(text) or _RE_ALPHA.match(text):
+                    return True
         except Exception as e:
             logger.debug(f"检查段落文本时出错: {str(e)}")
         
@@ -275,33 +303,34 @@ class WordToMarkdownConverter:
                 is_ordered = True
         
         # 简单的文本匹配判断
-        if re.match(r'^\d+\.', text.strip()):
+        if _RE_ORDERED.match(text.strip()):
             is_ordered = True
         
         # 移除原有的列表标记
-        cleaned_text = re.sub(r'^[•·○■▪\-\*]\s*', '', text.strip())
-        cleaned_text = re.sub(r'^\d+\.\s*', '', cleaned_text)
-        cleaned_text = re.sub(r'^[a-zA-Z]\.\s*', '', cleaned_text)
+        cleaned_text = _RE_LIST_PREFIX.sub('', text.strip(), count=1)
         
         # 生成Markdown列表项
         if is_ordered:
-            self.markdown_content.append(f"1. {cleaned_text}")
+            self._emit(f"1. {cleaned_text}")
         else:
-            self.markdown_content.append(f"- {cleaned_text}")
+            self._emit(f"- {cleaned_text}")
     
     def _process_normal_paragraph(self, paragraph: Paragraph):
         """处理普通段落"""
         text = self._extract_text_with_formatting(paragraph)
         
         if text.strip():
-            self.markdown_content.append(text)
-            self.markdown_content.append('')  # 添加空行
+            self._emit_block(text)
     
     def _extract_text_with_formatting(self, paragraph: Paragraph) -> str:
         """提取段落文本并保留格式"""
         if paragraph is None:
             return ""
         
+        # 不保留格式时直接使用段落的纯文本
+        if not self.preserve_formatting:
+            return paragraph.text or ""
+        
         result = []
         
         try:
@@ -313,28 +342,34 @@ class WordToMarkdownConverter:
                 if not text:
                     continue
                 
-                if self.preserve_formatting:
-                    try:
-                        # 应用格式
-                        if run.bold:
-                            text = f"**{text}**"
-                        if run.italic:
-                            text = f"*{text}*"
-                        if run.underline:
-                            text = f"<u>{text}</u>"
-                        
-                        # 处理删除线
-                        if hasattr(run.font, 'strike') and run.font.strike:
-                            text = f"~~{text}~~"
-                        
-                        # 处理上标和下标
-                        if run.font and hasattr(run.font, 'superscript') and run.font.superscript:
-                            text = f"<sup>{text}</sup>"
-                        elif run.font and hasattr(run.font, 'subscript') and run.font.subscript:
-                            text = f"<sub>{text}</sub>"
-                    except Exception as e:
-                        logger.debug(f"处理文本格式时出错: {str(e)}")
+                # 每个格式属性只读取一次，避免重复解析底层XML
+                font = run.font
+                bold = run.bold
+                italic = run.italic
+                underline = run.underline
+                strike = getattr(font, 'strike', None)
+                superscript = getattr(font, 'superscript', None)
+                subscript = getattr(font, 'subscript', None)
                 
+                if bold or italic or underline or strike or superscript or subscript:
+                    # 应用格式
+                    if bold:
+                        text = f"**{text}**"
+                    if italic:
+                        text = f"*{text}*"
+                    if underline:
+                        text = f"<u>{text}</u>"
+                    
+                    # 处理删除线
+                    if strike:
+                        text = f"~~{text}~~"
+                    
+                    # 处理上标和下标
+                    if superscript:
+                        text = f"<sup>{text}</sup>"
+                    elif subscript:
+                        text = f"<sub>{text}</sub>"
+
                 result.append(text)
         except Exception as e:
             logger.warning(f"提取段落文本时出错: {str(e)}")
@@ -352,54 +387,95 @@ class WordToMarkdownConverter:
             return
             
         try:
-            if not table.rows:
+            # 直接遍历底层的行元素，避免 row.cells 对合并单元格的重复展开和查找
+            tr_lst = table._tbl.tr_lst
+            if not tr_lst:
                 return
             
-            markdown_table = []
+            has_rows = False  # 是否已输出表格行
+            # 上一行各网格列的单元格文本，用于纵向合并的单元格
+            above = {}
             
             # 处理表头
-            if table.rows:
+            if tr_lst:
                 try:
-                    header_row = table.rows[0]
                     headers = []
-                    for cell in header_row.cells:
-                        cell_text = self._extract_cell_text(cell)
+                    for cell_text in self._extract_row_texts(tr_lst[0], table, above):
                         headers.append(cell_text.strip())
                     
                     if headers:  # 确保有表头内容
-                        markdown_table.append('| ' + ' | '.join(headers) + ' |')
-                        markdown_table.append('| ' + ' | '.join(['---'] * len(headers)) + ' |')
+                        self._emit('| ' + ' | '.join(headers) + ' |')
+                        self._emit('| ' + ' | '.join(['---'] * len(headers)) + ' |')
+                        has_rows = True
                 except Exception as e:
                     logger.warning(f"处理表头时出错: {str(e)}")
                     return
             
             # 处理数据行
             try:
-                for row in table.rows[1:]:
+                for tr in tr_lst[1:]:
                     row_data = []
-                    for cell in row.cells:
-                        try:
-                            cell_text = self._extract_cell_text(cell)
-                            # 替换表格中的换行符
-                            cell_text = cell_text.replace('\n', '<br>')
-                            row_data.append(cell_text.strip())
-                        except Exception as e:
-                            logger.debug(f"处理单元格时出错: {str(e)}")
-                            row_data.append("")  # 添加空单元格
+                    for cell_text in self._extract_row_texts(tr, table, above):
+                        # 替换表格中的换行符
+                        row_data.append(cell_text.replace('\n', '<br>').strip())
                     
                     if row_data:  # 确保行有数据
-                        markdown_table.append('| ' + ' | '.join(row_data) + ' |')
+                        self._emit('| ' + ' | '.join(row_data) + ' |')
+                        has_rows = True
             except Exception as e:
                 logger.warning(f"处理表格行时出错: {str(e)}")
             
-            # 添加表格到内容
-            if markdown_table:
-                self.markdown_content.extend(markdown_table)
-                self.markdown_content.append('')  # 添加空行
+            # 表格结束后添加空行
+            if has_rows:
+                self._emit('')
                 
         except Exception as e:
             logger.warning(f"处理表格时出错: {str(e)}")
     
+    def _extract_row_texts(self, tr: CT_Row, table: Table, above: Dict[int, str]) -> List[str]:
+        """
+        按网格列提取一行中各单元格的文本
+        
+        与 row.cells 的结果一致：横向合并的单元格按跨越的列数重复，
+        纵向合并的后续单元格沿用上一行同列的文本，但每个单元格只提取一次。
+        
+        Args:
+            tr: 行元素
+            table: 所属表格
+            above: 上一行各网格列的单元格文本，会被更新为本行的文本
+        """
+        texts = []
+        col = tr.grid_before
+        for tc in tr.tc_lst:
+            span = tc.grid_span
+            if tc.vMerge == 'continue':
+                cell_text = above.get(col, "")
+            else:
+                try:
+                    cell_text = self._extract_tc_text(tc, table)
+                except Exception as e:
+                    logger.debug(f"处理单元格时出错: {str(e)}")
+                    cell_text = ""  # 添加空单元格
+            
+            for offset in range(span):
+                above[col + offset] = cell_text
+            texts.extend([cell_text] * span)
+            col += span
+        
+        return texts
+    
+    def _extract_tc_text(self, tc: CT_Tc, table: Table) -> str:
+        """提取单元格元素的文本，只有需要保留格式时才构造 _Cell"""
+        if self.preserve_formatting:
+            return self._extract_cell_text(_Cell(tc, table))
+        
+        texts = []
+        for p in tc.p_lst:
+            text = p.text.strip()
+            if text:
+                texts.append(text)
+        return ' '.join(texts)
+    
     def _extract_cell_text(self, cell: _Cell) -> str:
         """提取单元格文本"""
         if cell is None: